@@ -1604,9 +1604,11 @@ class MAT(nn.Module):
 
         image = image * 2 - 1  # [0, 1] -> [-1, 1]
         mask = 1 - mask
+        z = self.z.expand(image.shape[0], -1)
+        label = self.label.expand(image.shape[0], -1)
 
         output = self.model(
-            image, mask, self.z, self.label, truncation_psi=1, noise_mode="none"
+            image, mask, z, label, truncation_psi=1, noise_mode="none"
         )
 
         return output * 0.5 + 0.5
@@ -1,5 +1,7 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
+import weakref
 import numpy as np
 import torch
 import torch.jit
@@ -44,6 +46,7 @@ class InpaintHead(nn.Module):
 
     def forward(self, x):
         x = F.pad(x, (1, 1, 1, 1), "replicate")
+        x = x.contiguous(memory_format=torch.channels_last)
         return F.conv2d(x, weight=self.head)
 
 
@@ -56,7 +59,7 @@ def load_fooocus_patch(lora: dict, to_load: dict):
             patch_dict[key] = ("fooocus", patch)
             loaded_keys.add(key)
     
-    not_loaded = len([x for x in lora if x not in loaded_keys])
+    not_loaded = len(lora.keys() - loaded_keys)
     print(f"[ApplyFooocusInpaint] {len(loaded_keys)} Lora keys loaded, {not_loaded} remaining keys not found in model.")
     
     return patch_dict
@@ -86,18 +89,36 @@ def calculate_weight_patched(self, patches, weight, key):
         alpha, v, _ = patch
         if isinstance(v, tuple) and v[0] == "fooocus":
             # Extracting the patch information
-            _, patch_values = v
-            w1 = torch.as_tensor(patch_values[0], device=weight.device, dtype=torch.float32)
-            
+            _, (w1, w_min, w_max) = v
+
             if w1.shape == weight.shape:
-                # Applying the patch with alpha blending
-                w_min = torch.as_tensor(patch_values[1], device=weight.device, dtype=torch.float32)
-                w_max = torch.as_tensor(patch_values[2], device=weight.device, dtype=torch.float32)
-                w1_normalized = (w1 / 255.0) * (w_max - w_min) + w_min
-                weight.data += alpha * w1_normalized
+                # Applying the patch with alpha blending:
+                # alpha * ((w1 / 255) * (w_max - w_min) + w_min) == scale * w1 + bias
+                w_min = cast_to_device(w_min, weight.device, torch.float32)
+                w_max = cast_to_device(w_max, weight.device, torch.float32)
+                scale = alpha * (w_max - w_min) / 255.0
+                bias = alpha * w_min
+                # patch_weight_to_device upcasts the weight to float32 before calculate_weight,
+                # so the two in-place updates don't add rounding over a single add
+                w1 = cast_to_device(w1, weight.device, torch.float32)
+                weight.data.addcmul_(w1, scale).add_(bias)
             else:
                 print(f"[ApplyFooocusInpaint] Shape mismatch {key}, weight not merged.")
         # If not a 'fooocus' patch or if any other conditions need to be checked, they can be added here
+
+
+# Lora key mapping only depends on the model architecture, cache it per loaded model
+_lora_key_cache = weakref.WeakKeyDictionary()
+
+
+def _model_lora_keys(model: BaseModel):
+    lora_keys = _lora_key_cache.get(model)
+    if lora_keys is None:
+        lora_keys = comfy.lora.model_lora_keys_unet(model, {})
+        _lora_key_cache[model] = lora_keys
+    return lora_keys
+
+
 class LoadFooocusInpaint:
     @classmethod
     def INPUT_TYPES(cls):
@@ -114,9 +135,12 @@ class LoadFooocusInpaint:
 
     def load(self, head: str, patch: str):
         head_file = folder_paths.get_full_path("inpaint", head)
-        inpaint_head_model = InpaintHead()
-        sd = torch.load(head_file, map_location="cpu")
-        inpaint_head_model.load_state_dict(sd)
+        # Build on the meta device and adopt the loaded weights (skips init and copy)
+        with torch.device("meta"):
+            inpaint_head_model = InpaintHead()
+        sd = torch.load(head_file, map_location="cpu", weights_only=True)
+        inpaint_head_model.load_state_dict(sd, assign=True)
+        inpaint_head_model.to(memory_format=torch.channels_last).eval()
 
         patch_file = folder_paths.get_full_path("inpaint", patch)
         inpaint_lora = comfy.utils.load_torch_file(patch_file, safe_load=True)
@@ -141,27 +165,31 @@ class ApplyFooocusInpaint:
     def patch(self, model: ModelPatcher, patch: tuple[InpaintHead, dict[str, Tensor]], latent: dict[str, Any]):
         base_model: BaseModel = model.model
         latent_pixels = base_model.process_latent_in(latent["samples"])
-        noise_mask = latent["noise_mask"].round()
-        latent_mask = F.max_pool2d(noise_mask, (8, 8)).round().to(latent_pixels.device)
+        # Blocking copy: if the mask lives on another device it has to arrive before pooling
+        noise_mask = latent["noise_mask"].to(latent_pixels.device)
+        # round is monotonic, so rounding after pooling gives the same result at 1/64 the size
+        latent_mask = F.max_pool2d(noise_mask, (8, 8)).round_()
 
         inpaint_head_model, inpaint_lora = patch
         feed = torch.cat([latent_mask, latent_pixels], dim=1)
-        inpaint_head_model.to(feed.device)
-        inpaint_head_feature = inpaint_head_model(feed)
+        if inpaint_head_model.head.device != feed.device:
+            inpaint_head_model.to(feed.device, memory_format=torch.channels_last)
+        with torch.inference_mode():
+            inpaint_head_feature = inpaint_head_model(feed)
 
         def input_block_patch(h, transformer_options):
             if transformer_options["block"][1] == 0:
                 h = h + inpaint_head_feature
             return h
 
-        lora_keys = comfy.lora.model_lora_keys_unet(model.model, {})
+        lora_keys = _model_lora_keys(base_model)
         loaded_lora = load_fooocus_patch(inpaint_lora, lora_keys)
 
         m = model.clone()
         m.set_model_input_block_patch(input_block_patch)
-        m.add_patches(loaded_lora, 1.0)
+        patched = m.add_patches(loaded_lora, 1.0)
 
-        not_patched_count = sum(1 for x in loaded_lora if x not in m)
+        not_patched_count = len(loaded_lora.keys() - set(patched))
         if not_patched_count > 0:
             print(f"[ApplyFooocusInpaint] Failed to patch {not_patched_count} keys")
 
@@ -191,29 +219,6 @@ class VAEEncodeInpaintConditioning:
         return encoded
 
 
-
-class VAEEncodeInpaintConditioning:
-    @classmethod
-    def INPUT_TYPES(cls):
-        return {
-            "required": {
-                "positive": ("CONDITIONING",),
-                "negative": ("CONDITIONING",),
-                "vae": ("VAE",),
-                "pixels": ("IMAGE",),
-                "mask": ("MASK",),
-            }
-        }
-
-    RETURN_TYPES = ("CONDITIONING", "CONDITIONING", "LATENT", "LATENT")
-    FUNCTION = "encode"
-    CATEGORY = "inpaint"
-
-    def encode(self, positive, negative, vae, pixels, mask):
-        # Assuming nodes.InpaintModelConditioning().encode(...) is correctly implemented elsewhere
-        encoded = nodes.InpaintModelConditioning().encode(positive, negative, pixels, vae, mask)
-        return encoded
-
 class MaskedFill:
     @classmethod
     def INPUT_TYPES(cls):
@@ -232,19 +237,21 @@ class MaskedFill:
 
     def fill(self, image: Tensor, mask: Tensor, fill: str, falloff: int):
         image = image.detach().clone()
-        alpha = mask.expand(1, *mask.shape[-2:]).floor()
+        # Bool mask (same as floor() for values in [0, 1]), only converted to float for falloff
+        alpha = mask.expand(1, *mask.shape[-2:]) >= 1.0
         falloff = make_odd(falloff)
 
         if falloff > 0:
+            alpha = alpha.to(image.dtype)
             erosion = binary_erosion(alpha, falloff)
             alpha = alpha * gaussian_blur(erosion, falloff)
 
         if fill == "neutral":
-            m = (1.0 - alpha).squeeze(1)
-            for i in range(3):
-                image[:, :, :, i] -= 0.5
-                image[:, :, :, i] *= m
-                image[:, :, :, i] += 0.5
+            alpha_hw1 = alpha.squeeze(1).unsqueeze(-1)
+            if falloff > 0:
+                image.mul_(1.0 - alpha_hw1).add_(0.5 * alpha_hw1)
+            else:
+                image.masked_fill_(alpha_hw1, 0.5)
         else:
             import cv2
             method = cv2.INPAINT_TELEA if fill == "telea" else cv2.INPAINT_NS
@@ -252,12 +259,22 @@ class MaskedFill:
             alpha_np = alpha.squeeze(0).cpu().numpy()
             alpha_bc = alpha_np.reshape(*alpha_np.shape, 1)
 
-            for slice in image:
-                image_np = slice.cpu().numpy()
-                filled_np = cv2.inpaint((255.0 * image_np).astype(np.uint8), (255.0 * alpha_np).astype(np.uint8), 3, method)
-                filled_np = filled_np.astype(np.float32) / 255.0
+            alpha_u8 = (255.0 * alpha_np).astype(np.uint8)
+            image_np = image.cpu().numpy()
+            image_u8 = (255.0 * image_np).astype(np.uint8)
+
+            def inpaint_slice(slice_u8: np.ndarray):
+                return cv2.inpaint(slice_u8, alpha_u8, 3, method)
+
+            # OpenCV releases the GIL, so batch items are filled in parallel
+            with ThreadPoolExecutor(max_workers=min(8, len(image_u8))) as executor:
+                filled_np = np.stack(list(executor.map(inpaint_slice, image_u8)))
+            filled_np = filled_np.astype(np.float32) / 255.0
+            if falloff > 0:
                 filled_np = image_np * (1.0 - alpha_bc) + filled_np * alpha_bc
-                slice.copy_(torch.from_numpy(filled_np))
+            else:  # alpha is a bool mask
+                filled_np = np.where(alpha_bc, filled_np, image_np)
+            image.copy_(torch.from_numpy(filled_np))
 
         return (image,)
 
@@ -323,12 +340,22 @@ class LoadInpaintModel:
             # MAT model
             model = mat.load(sd)
         else:
-            # Spandrel model
+            # Spandrel model. Converted to channels-last once here; MAT stays NCHW because its
+            # 5D modulated conv weights and batch-grouped views require it.
             model = spandrel.load(sd)
+            model.model.to(memory_format=torch.channels_last)
 
         model = model.eval()
         return (model,)
 
+
+def _input_memory_format(model):
+    # Matches the weight layout chosen in LoadInpaintModel
+    if isinstance(model, spandrel.ModelDescriptor):
+        return torch.channels_last
+    return torch.contiguous_format
+
+
 class InpaintWithModel:
     @classmethod
     def INPUT_TYPES(cls):
@@ -365,40 +392,38 @@ class InpaintWithModel:
 
         # No device switching needed; ensure everything operates on CPU.
         inpaint_model.cpu()
+        memory_format = _input_memory_format(inpaint_model)
 
         # Load and prepare the optional upscale model, if provided, ensuring it also operates on CPU.
         if optional_upscale_model is not None:
             upscaler = ModelLoader().load_from_file(optional_upscale_model).cpu().eval()
 
         # Prepare image and mask tensors, ensuring they are on the CPU.
-        image, mask = to_torch(image, mask).cpu(), to_torch(mask).cpu()
+        image, mask = to_torch(image, mask)
+        image, mask = image.cpu(), mask.cpu()
 
         batch_size = image.shape[0]
         if mask.shape[0] != batch_size:
             mask = mask[0].unsqueeze(0).repeat(batch_size, 1, 1, 1)
 
-        batch_image = []
+        # All images in a batch share the same size, so they are resized and inpainted together
+        work_image, work_mask, original_size = resize_square(image, mask, required_size)
+        work_mask = work_mask.floor()
+        work_image = work_image.contiguous(memory_format=memory_format)
 
-        for i in range(batch_size):
-            work_image, work_mask = image[i].unsqueeze(0), mask[i].unsqueeze(0)
-            work_image, work_mask, original_size = resize_square(work_image, work_mask, required_size)
-            work_mask = work_mask.floor()
-
-            torch.manual_seed(seed)
+        torch.manual_seed(seed)
+        with torch.inference_mode():
             work_image = inpaint_model(work_image, work_mask)
 
             if optional_upscale_model is not None:
                 work_image = work_image.movedim(1, -1)
-                with torch.no_grad():
-                    work_image = upscaler(work_image)
+                work_image = upscaler(work_image)
                 work_image = work_image.movedim(-1, 1)
 
-            work_image = undo_resize_square(work_image, original_size)
-            work_image = image[i] + (work_image - image[i]) * mask[i].floor()
-
-            batch_image.append(work_image)
+        work_image = undo_resize_square(work_image, original_size)
+        # Binary composite (mask.floor() is 0 or 1): a single select instead of difference and product
+        result = torch.where(mask >= 1.0, work_image, image)
 
-        result = torch.cat(batch_image, dim=0)
         return (to_comfy(result),)
 
 
@@ -425,6 +450,8 @@ class DenoiseToCompositingMask:
 
     def convert(self, mask: Tensor, offset: float, threshold: float):
         assert 0.0 <= offset < threshold <= 1.0, "Threshold must be higher than offset"
-        mask = (mask - offset) * (1 / (threshold - offset))
-        mask = mask.clamp(0, 1)
+        if mask.dtype == torch.bool:  # binary masks map to themselves since threshold <= 1
+            return (mask.float(),)
+        # sub allocates the output, scale and clamp then run in place on it
+        mask = mask.sub(offset).mul_(1 / (threshold - offset)).clamp_(0, 1)
         return (mask,)
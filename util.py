@@ -76,12 +76,30 @@ def _gaussian_kernel(radius: int, sigma: float):
     return pdf / pdf.sum()
 
 
+# above this radius the separable blur is computed via FFT, which doesn't scale with kernel size
+fft_blur_min_radius = 64
+
+
+def _fft_convolve_last_dim(x: Tensor, kernel: Tensor):
+    # "valid" convolution along the last dimension (output shrinks by kernel size - 1)
+    n, k = x.shape[-1], kernel.shape[-1]
+    size = n + k - 1
+    spectrum = torch.fft.rfft(x.float(), n=size) * torch.fft.rfft(kernel, n=size)
+    return torch.fft.irfft(spectrum, n=size)[..., k - 1 : n].to(x.dtype)
+
+
 def gaussian_blur(image: Tensor, radius: int, sigma: float = 0):
     c = image.shape[-3]
     if sigma <= 0:
         sigma = 0.3 * (radius - 1) + 0.8
 
     kernel = _gaussian_kernel(radius, sigma).to(image.device)
+    if radius > fft_blur_min_radius:
+        image = F.pad(image, (radius, radius, radius, radius), mode="reflect")
+        image = _fft_convolve_last_dim(image, kernel)
+        image = _fft_convolve_last_dim(image.transpose(-1, -2), kernel).transpose(-1, -2)
+        return image
+
     kernel_x = kernel[..., None, :].repeat(c, 1, 1).unsqueeze(1)
     kernel_y = kernel[..., None].repeat(c, 1, 1).unsqueeze(1)
 